@@ -1,12 +1,36 @@
+import contextlib
+import csv
+import gzip
+import hashlib
+import http.cookiejar
+import io
 import json
+import math
 import os
-from datetime import datetime
-from typing import Any, Dict, List, Optional
-from urllib.parse import urlparse
-
+import re
+import stat
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+import pandas as pd
 import requests
 import streamlit as st
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:  # optional speedup; stdlib json is used as fallback
+    orjson = None
+
+try:
+    import xxhash
+except ImportError:  # optional speedup; hashlib.blake2b is used as fallback
+    xxhash = None
 
 load_dotenv()
 
@@ -16,6 +40,12 @@ load_dotenv()
 DEFAULT_API_BASE = os.getenv("TESTGEN_API_BASE", "http://localhost:8000")
 DRAFT_DIR = os.getenv("TESTGEN_UI_DRAFT_DIR", "./ui_drafts")
 os.makedirs(DRAFT_DIR, exist_ok=True)
+# Only enable when the backend decompresses request bodies (Content-Encoding: gzip).
+GZIP_REQUESTS = os.getenv("TESTGEN_UI_GZIP_REQUESTS", "").strip().lower() in ("1", "true", "yes")
+GZIP_MIN_BYTES = 16 * 1024
+
+# http(s) scheme + non-empty host, no whitespace anywhere.
+_HTTP_URL_RE = re.compile(r"^https?://[^\s/?#]+(?:[/?#]\S*)?$", re.IGNORECASE)
 
 st.set_page_config(
     page_title="QA Agent – Test Generator",
@@ -27,24 +57,123 @@ st.set_page_config(
 # ============================================================
 # Helpers
 # ============================================================
-def api_post(base_url: str, path: str, payload: Dict[str, Any], timeout: int = 180) -> Dict[str, Any]:
-    url = base_url.rstrip("/") + path
-    r = requests.post(url, json=payload, timeout=timeout)
+def _json_dumps(obj: Any, indent: bool = False, sort_keys: bool = False) -> bytes:
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, option=option)
+        except orjson.JSONEncodeError:
+            pass  # e.g. integers beyond 64 bits or nesting deeper than 254; stdlib json copes
+    return json.dumps(obj, indent=2 if indent else None, sort_keys=sort_keys, ensure_ascii=False).encode("utf-8")
+
+
+def _json_loads(raw: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def state_key(obj: Any) -> str:
+    # Content hash of a JSON-able value, for cache keys and change detection.
+    raw = _json_dumps(obj, sort_keys=True)
+    if xxhash is not None:
+        return xxhash.xxh3_64_hexdigest(raw)
+    return hashlib.blake2b(raw, digest_size=8).hexdigest()
+
+
+def _response_json(r: requests.Response) -> Any:
+    # Parse the body bytes directly; r.json()/r.text would decode to str first
+    # (with charset sniffing when the server sends no charset).
+    raw = r.content
     try:
-        data = r.json()
-    except Exception:
-        data = {"raw_text": r.text}
+        return _json_loads(raw)
+    except ValueError:
+        return {"raw_text": raw.decode("utf-8", "replace")}
+
+
+def _request_body(payload: Dict[str, Any], accept: str) -> Tuple[bytes, Dict[str, str]]:
+    body = _json_dumps(payload)
+    headers = {"Content-Type": "application/json", "Accept": accept}
+    if GZIP_REQUESTS and len(body) > GZIP_MIN_BYTES:
+        body = gzip.compress(body, compresslevel=3)
+        headers["Content-Encoding"] = "gzip"
+    return body, headers
+
+
+@st.cache_resource(show_spinner=False)
+def get_session() -> requests.Session:
+    # One keep-alive connection pool per server process, shared across reruns and sessions.
+    session = requests.Session()
+    # The session is shared by every browser session on this server, so it must not carry cookies
+    # from one user's responses into another user's requests.
+    session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+    # urllib3 only retries idempotent methods on 5xx, so POSTs (generation, Jira push) are never
+    # replayed once sent; connect failures are retried for every method. Read timeouts are not
+    # retried (read=False), so a slow backend fails after one timeout with requests' ReadTimeout.
+    retry = Retry(total=2, read=False, backoff_factor=0.3, status_forcelist=[502, 503, 504], raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def api_post_raw(base_url: str, path: str, payload: Dict[str, Any], timeout: int = 180) -> Tuple[Dict[str, Any], bytes]:
+    # Like api_post, but also returns the response body bytes for display without re-encoding.
+    url = base_url.rstrip("/") + path
+    body, headers = _request_body(payload, "application/json")
+    r = get_session().post(url, data=body, headers=headers, timeout=timeout)
+    data = _response_json(r)
     if not r.ok:
         raise RuntimeError(f"API Error {r.status_code} at {path}: {data}")
-    return data
+    return data, r.content
+
+
+def api_post(base_url: str, path: str, payload: Dict[str, Any], timeout: int = 180) -> Dict[str, Any]:
+    return api_post_raw(base_url, path, payload, timeout=timeout)[0]
+
+
+def api_post_stream(
+    base_url: str, path: str, payload: Dict[str, Any], timeout: Tuple[int, int] = (10, 900)
+) -> Iterator[Dict[str, Any]]:
+    # Yields NDJSON events as they arrive; `timeout` is (connect, per-read), not a total budget.
+    # A backend that answers with a single JSON document yields one {"scenario_pack", "raw"} event.
+    url = base_url.rstrip("/") + path
+    body, headers = _request_body(payload, "application/x-ndjson, application/json")
+    with get_session().post(url, data=body, headers=headers, timeout=timeout, stream=True) as r:
+        if not r.ok:
+            raise RuntimeError(f"API Error {r.status_code} at {path}: {_response_json(r)}")
+        ct = (r.headers.get("content-type") or "").lower()
+        if "ndjson" not in ct:
+            yield {"scenario_pack": _response_json(r), "raw": r.content}
+            return
+        for line in r.iter_lines():
+            if line:
+                yield _json_loads(line)
+
+
+def api_post_many(
+    base_url: str, path: str, payloads: List[Dict[str, Any]], max_workers: int = 8, timeout: int = 120
+) -> Iterator[Tuple[int, Any, Optional[Exception]]]:
+    # POSTs payloads concurrently over the shared session; yields (payload index, response, error)
+    # as each request finishes, so one failed request never hides the others' results.
+    get_session()  # warm the cached session on the script thread before workers use it
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(api_post, base_url, path, p, timeout=timeout): i for i, p in enumerate(payloads)}
+        for fut in as_completed(futures):
+            err = fut.exception()
+            yield futures[fut], None if err else fut.result(), err
 
 
 def api_get(base_url: str, path: str, timeout: int = 60) -> Any:
     url = base_url.rstrip("/") + path
-    r = requests.get(url, timeout=timeout)
+    r = get_session().get(url, timeout=timeout)
     ct = (r.headers.get("content-type") or "").lower()
     if "application/json" in ct:
-        data = r.json()
+        data = _response_json(r)
     else:
         data = r.text
     if not r.ok:
@@ -53,36 +182,95 @@ def api_get(base_url: str, path: str, timeout: int = 60) -> Any:
 
 
 def pretty(obj: Any) -> str:
-    return json.dumps(obj, indent=2, ensure_ascii=False)
+    return _json_dumps(obj, indent=True).decode("utf-8")
+
+
+def pretty_bytes(obj: Any) -> bytes:
+    # st.download_button takes bytes as-is, so skip the str round-trip.
+    return _json_dumps(obj, indent=True)
+
+
+T = TypeVar("T")
+
+
+def session_memo(slot: str, owner: Any, build: Callable[[], T]) -> T:
+    # Per-session memo, dropped as soon as `owner` is replaced by a different object.
+    # Only use for values that are replaced (not mutated in place) when they change.
+    memo = st.session_state.setdefault("_memo", {})
+    hit = memo.get(slot)
+    if hit is not None and hit[0] is owner:
+        return hit[1]
+    value = build()
+    memo[slot] = (owner, value)
+    return value
+
+
+def pretty_in_pack(sp: Dict[str, Any], obj: Any) -> str:
+    # Pretty JSON for a scenario/test case inside `sp`. The memo holds `sp`, so id(obj) stays unique.
+    cache = session_memo("pack_item_json", sp, dict)
+    key = id(obj)
+    if key not in cache:
+        cache[key] = pretty(obj)
+    return cache[key]
 
 
 def now_stamp() -> str:
+    from datetime import datetime
+
     return datetime.now().strftime("%Y%m%d_%H%M%S")
 
 
+@st.cache_resource(show_spinner=False)
+def _default_file_mode() -> int:
+    # The umask can only be read by setting it, so do that once per process.
+    mask = os.umask(0)
+    os.umask(mask)
+    return 0o666 & ~mask
+
+
 def save_draft(name: str, state: Dict[str, Any]) -> str:
     path = os.path.join(DRAFT_DIR, f"{name}.json")
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(state, f, indent=2)
+    # Write-then-rename so a crash mid-write never leaves a truncated draft behind; the temp name is
+    # unique so concurrent saves of the same draft don't race on it.
+    with tempfile.NamedTemporaryFile(dir=DRAFT_DIR, prefix=f"{name}.", suffix=".tmp", delete=False) as f:
+        tmp = f.name
+        try:
+            f.write(_json_dumps(state, indent=True))
+        except BaseException:
+            f.close()
+            os.unlink(tmp)
+            raise
+    try:
+        # NamedTemporaryFile is created 0600; keep the mode a plain open() (or the existing draft) would have.
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            mode = _default_file_mode()
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
     return path
 
 
+@st.cache_data(show_spinner=False, max_entries=4)
+def _scan_drafts(dir_mtime_ns: int) -> List[str]:
+    # dir_mtime_ns is only the cache key: the listing is rescanned when files are added/removed.
+    with os.scandir(DRAFT_DIR) as it:
+        return sorted(e.name for e in it if e.name.endswith(".json") and e.is_file(follow_symlinks=False))
+
+
 def list_drafts() -> List[str]:
-    return sorted([f for f in os.listdir(DRAFT_DIR) if f.endswith(".json")])
+    return _scan_drafts(os.stat(DRAFT_DIR).st_mtime_ns)
 
 
 def load_draft(filename: str) -> Dict[str, Any]:
-    path = os.path.join(DRAFT_DIR, filename)
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return _json_loads(Path(DRAFT_DIR, filename).read_bytes())
 
 
 def is_valid_http_url(u: str) -> bool:
-    try:
-        p = urlparse(u.strip())
-        return p.scheme in ("http", "https") and bool(p.netloc)
-    except Exception:
-        return False
+    return _HTTP_URL_RE.match(u.strip()) is not None
 
 
 def guess_source_type_from_url(u: str) -> str:
@@ -90,33 +278,36 @@ def guess_source_type_from_url(u: str) -> str:
     return "pdf" if u.endswith(".pdf") else "web"
 
 
-def default_project_settings() -> Dict[str, Any]:
-    # This maps to backend ProductPack.
-    return {
-        "product": {
-            "name": "RFID Scanner",
-            "vendor": "Zebra",
-            "domain": "Warehouse RFID",
-            "version": None,
-        },
-        "requirements": [],  # Will be fetched from Jira (preferred)
-        "business_rules": {
-            "rules_text": (
-                "Unauthorized = EPC not in allowed inventory OR duplicate EPC detected.\n"
-                "If unauthorized: block transaction + raise alert.\n"
-                "RFID retry count = 2.\n"
-                "SLA: single-tag read <= 500ms.\n"
-            )
-        },
-        "output": {
-            "hierarchy": "Scenario->TestCase",
-            "jira": {
-                "project_key": "ABC",
-                "scenario_issue_type": "Task",
-                "testcase_issue_type": "Sub-task",
-            },
+# This maps to backend ProductPack. Encoded once; decoding gives every caller a fresh deep copy.
+_DEFAULT_PROJECT_SETTINGS = _json_dumps({
+    "product": {
+        "name": "RFID Scanner",
+        "vendor": "Zebra",
+        "domain": "Warehouse RFID",
+        "version": None,
+    },
+    "requirements": [],  # Will be fetched from Jira (preferred)
+    "business_rules": {
+        "rules_text": (
+            "Unauthorized = EPC not in allowed inventory OR duplicate EPC detected.\n"
+            "If unauthorized: block transaction + raise alert.\n"
+            "RFID retry count = 2.\n"
+            "SLA: single-tag read <= 500ms.\n"
+        )
+    },
+    "output": {
+        "hierarchy": "Scenario->TestCase",
+        "jira": {
+            "project_key": "ABC",
+            "scenario_issue_type": "Task",
+            "testcase_issue_type": "Sub-task",
         },
-    }
+    },
+})
+
+
+def default_project_settings() -> Dict[str, Any]:
+    return _json_loads(_DEFAULT_PROJECT_SETTINGS)
 
 
 def requirements_count(pp: Dict[str, Any]) -> int:
@@ -130,10 +321,272 @@ def scenario_list(sp: Dict[str, Any]) -> List[Dict[str, Any]]:
 
 
 def total_testcases(sp: Dict[str, Any]) -> int:
-    total = 0
+    return pack_counts(sp)[1]
+
+
+def add_source(src: Dict[str, Any]) -> bool:
+    # O(1) duplicate check on (type, url); the key set is rebuilt lazily after sources are replaced.
+    ss = st.session_state
+    keys = ss.get("_source_keys")
+    if keys is None:
+        keys = ss["_source_keys"] = {(x.get("type"), x.get("url")) for x in ss.sources}
+    key = (src.get("type"), src.get("url"))
+    if key in keys:
+        return False
+    ss.sources.append(src)
+    keys.add(key)
+    return True
+
+
+def pack_counts(sp: Dict[str, Any]) -> Tuple[int, int]:
+    # (scenarios, test cases) in a single walk of the pack.
+    def build():
+        scs = scenario_list(sp)
+        return len(scs), sum(len(s.get("test_cases") or []) for s in scs)
+
+    return session_memo("pack_counts", sp, build)
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def sources_frame(key: str, _sources: List[Dict[str, Any]]) -> pd.DataFrame:
+    # Cached on `key` only (Streamlit skips hashing underscore-prefixed args).
+    return pd.DataFrame(_sources)
+
+
+def scenario_search_index(sp: Dict[str, Any]) -> List[Tuple[Dict[str, Any], str]]:
+    def build():
+        return [(s, ((s.get("title") or "") + " " + (s.get("objective") or "")).lower()) for s in scenario_list(sp)]
+
+    return session_memo("scenario_search_index", sp, build)
+
+
+PROGRESS_LABELS = (
+    "Add documentation sources",
+    "Build knowledge base",
+    "Link Jira issue",
+    "Import requirements",
+    "Generate scenarios",
+    "Generate test cases",
+)
+
+
+def progress_flags() -> Tuple[bool, bool, bool, bool, bool, bool]:
+    # Only O(1) checks here; test-case counting is memoized per pack in pack_counts().
+    ss = st.session_state
+    n_sc, n_tc = pack_counts(ss.scenario_pack)
+    return (
+        bool(ss.sources),
+        bool(ss.last_index_result) or ss.kb_ready,
+        bool((ss.jira_issue_key or "").strip()),
+        bool(ss.fetched_requirements),
+        n_sc > 0,
+        n_tc > 0,
+    )
+
+
+def flat_testcases_csv(sp: Dict[str, Any]) -> io.BytesIO:
+    # csv.writer quotes fields containing commas/quotes/newlines instead of mangling them.
+    # Rows are encoded straight into one bytes buffer (no row list, no intermediate str), which
+    # st.download_button accepts as-is.
+    buf = io.BytesIO()
+    text = io.TextIOWrapper(buf, encoding="utf-8", newline="")
+    w = csv.writer(text)
+    w.writerow(["scenario_id", "scenario_title", "tc_id", "tc_title", "tc_type", "priority"])
     for s in scenario_list(sp):
-        total += len(s.get("test_cases") or [])
-    return total
+        sid, stitle = s.get("scenario_id") or "", s.get("title") or ""
+        for tc in s.get("test_cases") or ():
+            w.writerow((sid, stitle, tc.get("tc_id") or "", tc.get("title") or "", tc.get("type") or "", tc.get("priority") or ""))
+    text.flush()
+    text.detach()  # keep `buf` open when the wrapper is collected
+    return buf
+
+
+def scenario_titles(sp: Dict[str, Any]) -> List[str]:
+    def build():
+        return [f"{s.get('scenario_id','(no-id)')} — {s.get('title','(no-title)')}" for s in scenario_list(sp)]
+
+    return session_memo("scenario_titles", sp, build)
+
+
+@dataclass(slots=True)
+class TestCase:
+    # Read-only view of a backend test case dict; `raw` is the original dict inside the pack.
+    tc_id: str
+    title: str
+    type: str
+    priority: str
+    preconditions: List[Any]
+    steps: List[Any]
+    expected_results: List[Any]
+    references: List[Dict[str, Any]]
+    raw: Dict[str, Any]
+
+    @classmethod
+    def from_dict(cls, tc: Dict[str, Any]) -> "TestCase":
+        return cls(
+            tc_id=tc.get("tc_id") or "(no-id)",
+            title=tc.get("title") or "",
+            type=tc.get("type") or "",
+            priority=tc.get("priority") or "—",
+            preconditions=tc.get("preconditions") or [],
+            steps=tc.get("steps") or [],
+            expected_results=tc.get("expected_results") or [],
+            references=tc.get("references") or [],
+            raw=tc,
+        )
+
+
+def typed_testcases(sp: Dict[str, Any]) -> List[List[TestCase]]:
+    # Normalized once per pack: one list of TestCase per scenario, in pack order.
+    def build():
+        return [[TestCase.from_dict(tc) for tc in s.get("test_cases") or []] for s in scenario_list(sp)]
+
+    return session_memo("typed_testcases", sp, build)
+
+
+def testcase_index(sp: Dict[str, Any], scenario_idx: int) -> List[Tuple[str, TestCase]]:
+    # (lowercased title, test case) rows per scenario, built on first browse of that scenario.
+    cache = session_memo("testcase_index", sp, dict)
+    rows = cache.get(scenario_idx)
+    if rows is None:
+        rows = cache[scenario_idx] = [(tc.title.lower(), tc) for tc in typed_testcases(sp)[scenario_idx]]
+    return rows
+
+
+def jira_push_batches(scs: List[Dict[str, Any]], max_issues: int = 50) -> List[List[Dict[str, Any]]]:
+    # Scenarios are kept whole (test cases are sub-tasks of their scenario issue); a batch closes once
+    # adding the next scenario would exceed `max_issues` scenario + test case issues. `max_issues` is a
+    # target, not a hard cap: a single scenario with `max_issues` or more test cases gets its own,
+    # larger batch.
+    batches: List[List[Dict[str, Any]]] = []
+    cur: List[Dict[str, Any]] = []
+    size = 0
+    for s in scs:
+        n = 1 + len(s.get("test_cases") or [])
+        if cur and size + n > max_issues:
+            batches.append(cur)
+            cur, size = [], 0
+        cur.append(s)
+        size += n
+    if cur:
+        batches.append(cur)
+    return batches
+
+
+def merge_jira_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # List fields (scenario_keys, testcase_keys, ...) are concatenated; other fields keep the first value.
+    merged: Dict[str, Any] = {}
+    for res in results:
+        for k, v in res.items():
+            if isinstance(v, list):
+                merged.setdefault(k, []).extend(v)
+            else:
+                merged.setdefault(k, v)
+    return merged
+
+
+SCENARIO_TABLE_MIN_ROWS = 20
+TESTCASE_PAGE_SIZE = 10
+TESTCASE_TYPES = ("Functional", "Negative", "Edge", "Security", "Performance", "Recovery")
+REFS_PREVIEW = 5
+
+
+def scenario_table(scs: List[Dict[str, Any]]) -> pd.DataFrame:
+    return pd.DataFrame.from_records(
+        [
+            {
+                "scenario_id": s.get("scenario_id", "(no-id)"),
+                "title": s.get("title", "(no-title)"),
+                "objective": s.get("objective") or "",
+                "scope": len(s.get("scope") or []),
+                "test_cases": len(s.get("test_cases") or []),
+                "refs": len(s.get("references") or []),
+            }
+            for s in scs
+        ]
+    )
+
+
+def render_scenario_details(sp: Dict[str, Any], s: Dict[str, Any], dev: bool) -> None:
+    st.write(s.get("objective") or "—")
+    cols = st.columns(2)
+    with cols[0]:
+        st.caption("Scope")
+        scope = s.get("scope") or []
+        st.markdown("\n".join(f"- {x}" for x in scope) if scope else "—")
+    with cols[1]:
+        st.caption("Assumptions")
+        a = s.get("assumptions") or []
+        st.markdown("\n".join(f"- {x}" for x in a) if a else "—")
+
+    if dev:
+        st.divider()
+        st.caption("Raw JSON")
+        st.code(pretty_in_pack(sp, s), language="json")
+
+
+TESTCASE_CACHE_MAX = 4
+
+
+def testcases_request_key(payload: Dict[str, Any]) -> str:
+    # Existing test cases are the output of /v1/testcases, not an input, so they are left out
+    # of the key: regenerating right after a successful run hits the cached result.
+    sp = payload.get("scenario_pack") or {}
+    scenarios = [{k: v for k, v in s.items() if k != "test_cases"} for s in scenario_list(sp)]
+    return state_key({**payload, "scenario_pack": {**sp, "scenarios": scenarios}})
+
+
+def merge_testcase_events(
+    sp: Dict[str, Any], events: Iterator[Dict[str, Any]], on_progress: Optional[Callable[[int], None]] = None
+) -> Tuple[Dict[str, Any], Optional[bytes], bool]:
+    # Builds a new pack from /v1/testcases events: {"scenario_id", "test_case"} per generated
+    # test case, then {"done": true}; or a single {"scenario_pack"} event carrying the complete result.
+    # {"error"} events raise. Returns (pack, raw, complete): `complete` is False when the stream ended
+    # without a terminal event but did deliver test cases; an empty, unterminated stream raises.
+    pack = {**sp, "scenarios": [{**s, "test_cases": []} for s in scenario_list(sp)]}
+    by_id = {s.get("scenario_id"): s for s in pack["scenarios"]}
+    received = 0
+    for ev in events:
+        if ev.get("error") is not None:
+            raise RuntimeError(f"Test case generation failed after {received} test cases: {ev['error']}")
+        if "scenario_pack" in ev:
+            return ev["scenario_pack"], ev.get("raw"), True
+        if ev.get("done"):
+            return pack, None, True
+        if ev.get("test_case") is None:
+            continue  # keep-alive / progress events carry nothing to merge
+        s = by_id.get(ev.get("scenario_id"))
+        if s is None:
+            raise RuntimeError(f"Test case stream referenced unknown scenario {ev.get('scenario_id')!r}")
+        s["test_cases"].append(ev["test_case"])
+        received += 1
+        if on_progress is not None:
+            on_progress(received)
+    if not received:
+        raise RuntimeError("Test case stream ended without any test cases; existing test cases were kept.")
+    return pack, None, False
+
+
+def drop_session_memos(owner: Any) -> None:
+    # session_memo entries keep their owner alive; release them once the owner is replaced.
+    memo = st.session_state.get("_memo") or {}
+    for slot in [slot for slot, (o, _) in memo.items() if o is owner]:
+        del memo[slot]
+
+
+def set_scenario_pack(sp: Dict[str, Any], raw: Optional[bytes] = None) -> None:
+    # `raw` is the backend response body for `sp`, if any; cleared whenever the pack comes from elsewhere.
+    ss = st.session_state
+    old = ss.get("scenario_pack")
+    if old is not sp:
+        # Nothing else may pin the previous pack (or its Jira result): memo entries, raw bytes and
+        # the push result all describe the old pack and would otherwise live until overwritten.
+        drop_session_memos(old)
+        drop_session_memos(ss.get("last_jira_result"))
+        ss.last_jira_result = {}
+        ss.jira_pushed_scenarios = set()
+    ss.scenario_pack = sp
+    ss.scenario_pack_raw = raw
 
 
 def _init_state():
@@ -162,7 +615,10 @@ def _init_state():
 
     # Generated output
     ss.setdefault("scenario_pack", {})
+    ss.setdefault("scenario_pack_raw", None)
     ss.setdefault("last_jira_result", {})
+    # Positions (in scenario_pack["scenarios"]) already created in Jira, so a retry skips them.
+    ss.setdefault("jira_pushed_scenarios", set())
 
     # Friendly flags
     ss.setdefault("kb_ready", False)
@@ -193,20 +649,13 @@ with st.sidebar:
     st.divider()
 
     # Progress checklist
-    sources_ok = len(st.session_state.sources) > 0
-    kb_ok = bool(st.session_state.last_index_result) or st.session_state.kb_ready
-    jira_ok = bool((st.session_state.jira_issue_key or "").strip())
-    req_ok = len(st.session_state.fetched_requirements) > 0
-    sc_ok = len(scenario_list(st.session_state.scenario_pack)) > 0
-    tc_ok = total_testcases(st.session_state.scenario_pack) > 0
-
     st.markdown("### ✅ Progress")
-    st.write(("✅" if sources_ok else "⬜") + " Add documentation sources")
-    st.write(("✅" if kb_ok else "⬜") + " Build knowledge base")
-    st.write(("✅" if jira_ok else "⬜") + " Link Jira issue")
-    st.write(("✅" if req_ok else "⬜") + " Import requirements")
-    st.write(("✅" if sc_ok else "⬜") + " Generate scenarios")
-    st.write(("✅" if tc_ok else "⬜") + " Generate test cases")
+    st.markdown(
+        "\n\n".join(
+            ("✅" if ok else "⬜") + " " + label
+            for ok, label in zip(progress_flags(), PROGRESS_LABELS)
+        )
+    )
 
     st.divider()
 
@@ -220,22 +669,25 @@ with st.sidebar:
             data = load_draft(sel)
             # Restore expected fields with fallbacks
             st.session_state.sources = data.get("sources", [])
+            st.session_state.pop("_source_keys", None)
             st.session_state.last_index_result = data.get("last_index_result", {})
             st.session_state.jira_issue_key = data.get("jira_issue_key", "")
             st.session_state.fetched_requirements = data.get("fetched_requirements", [])
             st.session_state.product_pack = data.get("product_pack", default_project_settings())
-            st.session_state.scenario_pack = data.get("scenario_pack", {})
+            set_scenario_pack(data.get("scenario_pack", {}))
             st.session_state.last_jira_result = data.get("last_jira_result", {})
+            st.session_state.jira_pushed_scenarios = set(data.get("jira_pushed_scenarios", []))
             st.session_state.kb_ready = data.get("kb_ready", False)
             st.success("Draft loaded ✅")
     with c2:
         if st.button("New", use_container_width=True):
             st.session_state.sources = []
+            st.session_state.pop("_source_keys", None)
             st.session_state.last_index_result = {}
             st.session_state.jira_issue_key = ""
             st.session_state.fetched_requirements = []
             st.session_state.product_pack = default_project_settings()
-            st.session_state.scenario_pack = {}
+            set_scenario_pack({})
             st.session_state.last_jira_result = {}
             st.session_state.kb_ready = False
             st.success("Fresh start ✨")
@@ -250,10 +702,18 @@ with st.sidebar:
             "product_pack": st.session_state.product_pack,
             "scenario_pack": st.session_state.scenario_pack,
             "last_jira_result": st.session_state.last_jira_result,
+            "jira_pushed_scenarios": sorted(st.session_state.jira_pushed_scenarios),
             "kb_ready": st.session_state.kb_ready,
         }
-        p = save_draft(draft_name, state)
-        st.success(f"Saved ✅ ({p})")
+        key = state_key(state)
+        saved_keys = st.session_state.setdefault("_saved_draft_keys", {})
+        if saved_keys.get(draft_name) == key and os.path.exists(os.path.join(DRAFT_DIR, f"{draft_name}.json")):
+            st.info("No changes since this draft was last saved.")
+        else:
+            with st.spinner("Saving draft…"):
+                p = save_draft(draft_name, state)
+            saved_keys[draft_name] = key
+            st.success(f"Saved ✅ ({p})")
 
 # ============================================================
 # Header
@@ -276,6 +736,7 @@ st.session_state.step = st.selectbox("Where do you want to work?", steps, index=
 # STEP 1: Connect Documentation
 # ============================================================
 if st.session_state.step == "1) Connect Documentation":
+    ss = st.session_state
     st.subheader("1) Connect Documentation")
     st.caption("Add your product documentation links. We’ll build a Knowledge Base from these.")
 
@@ -308,72 +769,81 @@ if st.session_state.step == "1) Connect Documentation":
 
         add_disabled = not url_ok
         if st.button("➕ Add source", disabled=add_disabled):
-            st.session_state.sources.append(
+            added = add_source(
                 {
                     "type": chosen_type or "pdf",
                     "url": url_str,
                     "tags": [t.strip() for t in (tags or "").split(",") if t.strip()],
                 }
             )
-            st.success("Source added ✅")
+            if added:
+                st.success("Source added ✅")
+            else:
+                st.warning("This source is already in your list.")
 
         if url_str and not url_ok:
             st.error("Please enter a valid http/https URL.")
 
         st.markdown("### Your sources")
-        if st.session_state.sources:
-            st.dataframe(st.session_state.sources, use_container_width=True, hide_index=True)
+        if ss.sources:
+            st.dataframe(sources_frame(state_key(ss.sources), ss.sources), use_container_width=True, hide_index=True)
         else:
             st.info("No sources added yet. Add at least one PDF or web docs page.")
 
         c1, c2, c3 = st.columns(3)
         with c1:
-            if st.button("🧹 Clear sources", use_container_width=True, disabled=not st.session_state.sources):
-                st.session_state.sources = []
+            if st.button("🧹 Clear sources", use_container_width=True, disabled=not ss.sources):
+                ss.sources = []
+                ss.pop("_source_keys", None)
                 st.success("Cleared ✅")
         with c2:
             if st.button("✨ Add sample sources", use_container_width=True):
-                st.session_state.sources.extend(
-                    [
+                added = [
+                    add_source(src)
+                    for src in (
                         {"type": "web", "url": "https://example.com/rfid-docs/getting-started", "tags": ["sample", "web"]},
                         {"type": "pdf", "url": "https://example.com/rfid-product-guide.pdf", "tags": ["sample", "pdf"]},
-                    ]
-                )
-                st.success("Sample sources added ✅ (replace with your real links)")
+                    )
+                ]
+                if any(added):
+                    st.success("Sample sources added ✅ (replace with your real links)")
+                else:
+                    st.info("Sample sources are already in your list.")
         with c3:
             st.download_button(
                 "⬇️ Download sources.json",
-                data=pretty({"sources": st.session_state.sources}),
+                data=pretty_bytes({"sources": ss.sources}),
                 file_name="sources.json",
                 mime="application/json",
                 use_container_width=True,
-                disabled=not st.session_state.sources,
+                disabled=not ss.sources,
             )
 
-        if st.session_state.developer_mode:
+        if ss.developer_mode:
             with st.expander("Developer view: sources payload", expanded=False):
-                st.code(pretty({"tenant_id": st.session_state.project_name, "sources": st.session_state.sources}), language="json")
+                st.code(pretty({"tenant_id": ss.project_name, "sources": ss.sources}), language="json")
 
     with colB:
         st.markdown("### Build Knowledge Base")
         st.caption("This reads your docs and prepares the AI to answer with evidence.")
 
-        build_disabled = not st.session_state.sources
+        build_disabled = not ss.sources
         if st.button("🧠 Build knowledge base", type="primary", use_container_width=True, disabled=build_disabled):
             try:
-                payload = {"tenant_id": st.session_state.project_name, "sources": st.session_state.sources}
-                res = api_post(st.session_state.api_base, "/v1/index", payload, timeout=300)
-                st.session_state.last_index_result = res
-                st.session_state.kb_ready = True
+                payload = {"tenant_id": ss.project_name, "sources": ss.sources}
+                res = api_post(ss.api_base, "/v1/index", payload, timeout=300)
+                ss.last_index_result = res
+                ss.kb_ready = True
                 st.success("Knowledge base ready ✅")
             except Exception as e:
                 st.error(str(e))
 
-        if st.session_state.last_index_result:
+        if ss.last_index_result:
             st.markdown("### Last result")
             st.success("Indexing completed.")
-            if st.session_state.developer_mode:
-                st.code(pretty(st.session_state.last_index_result), language="json")
+            if ss.developer_mode:
+                res = ss.last_index_result
+                st.code(session_memo("index_json", res, lambda: pretty(res)), language="json")
         else:
             st.info("Build the knowledge base after adding sources.")
 
@@ -381,6 +851,7 @@ if st.session_state.step == "1) Connect Documentation":
 # STEP 2: Connect Jira & Import Requirements
 # ============================================================
 elif st.session_state.step == "2) Connect Jira & Import Requirements":
+    ss = st.session_state
     st.subheader("2) Connect Jira & Import Requirements")
     st.caption("Tell us the Jira story/bug and we’ll pull requirements from it.")
 
@@ -388,14 +859,14 @@ elif st.session_state.step == "2) Connect Jira & Import Requirements":
 
     with colA:
         st.markdown("### Jira issue")
-        st.session_state.jira_issue_key = st.text_input(
+        ss.jira_issue_key = st.text_input(
             "Issue key",
-            value=st.session_state.jira_issue_key,
+            value=ss.jira_issue_key,
             placeholder="RFID-123",
             help="Example: PROJ-123. Requirements should be in Description/Acceptance Criteria.",
         )
 
-        issue_key = (st.session_state.jira_issue_key or "").strip()
+        issue_key = (ss.jira_issue_key or "").strip()
 
         c1, c2 = st.columns(2)
         with c1:
@@ -405,10 +876,12 @@ elif st.session_state.step == "2) Connect Jira & Import Requirements":
                 # Fallback: still store issue_key and rely on /v1/scenarios to fetch server-side.
                 try:
                     # If you added GET /v1/jira/requirements/{issue_key}, this will work.
-                    reqs = api_get(st.session_state.api_base, f"/v1/jira/requirements/{issue_key}", timeout=120)
+                    reqs = api_get(ss.api_base, f"/v1/jira/requirements/{issue_key}", timeout=120)
                     if isinstance(reqs, list) and reqs:
-                        st.session_state.fetched_requirements = reqs
-                        st.session_state.requirements_last_fetched_at = datetime.now().strftime("%Y-%m-%d %H:%M")
+                        from datetime import datetime
+
+                        ss.fetched_requirements = reqs
+                        ss.requirements_last_fetched_at = datetime.now().strftime("%Y-%m-%d %H:%M")
                         st.success(f"Fetched {len(reqs)} requirements ✅")
                     else:
                         st.warning("No requirements found in Jira issue description.")
@@ -418,35 +891,34 @@ elif st.session_state.step == "2) Connect Jira & Import Requirements":
                         "Could not preview requirements from backend. "
                         "No worries — we can still fetch during generation (server-side)."
                     )
-                    if st.session_state.developer_mode:
+                    if ss.developer_mode:
                         st.code(str(e))
         with c2:
-            if st.button("🧹 Clear imported requirements", use_container_width=True, disabled=not st.session_state.fetched_requirements):
-                st.session_state.fetched_requirements = []
+            if st.button("🧹 Clear imported requirements", use_container_width=True, disabled=not ss.fetched_requirements):
+                ss.fetched_requirements = []
                 st.success("Cleared ✅")
 
         st.markdown("### Imported requirements (preview)")
-        if st.session_state.fetched_requirements:
+        if ss.fetched_requirements:
             # Show friendly bullets
-            for r in st.session_state.fetched_requirements[:50]:
-                st.write(f"- **{r.get('id','REQ')}**: {r.get('statement','')}")
-            if len(st.session_state.fetched_requirements) > 50:
-                st.caption(f"Showing first 50 of {len(st.session_state.fetched_requirements)}")
+            st.markdown("\n".join(f"- **{r.get('id','REQ')}**: {r.get('statement','')}" for r in ss.fetched_requirements[:50]))
+            if len(ss.fetched_requirements) > 50:
+                st.caption(f"Showing first 50 of {len(ss.fetched_requirements)}")
 
             st.divider()
             if st.button("✅ Use these requirements", use_container_width=True):
-                st.session_state.product_pack["requirements"] = st.session_state.fetched_requirements
+                ss.product_pack["requirements"] = ss.fetched_requirements
                 st.success("Requirements applied to project settings ✅")
         else:
             st.info("Fetch requirements to preview them here. Or skip preview and generate directly (server will fetch during generation).")
 
-        if st.session_state.developer_mode and st.session_state.fetched_requirements:
+        if ss.developer_mode and ss.fetched_requirements:
             with st.expander("Developer view: raw requirements JSON", expanded=False):
-                st.code(pretty(st.session_state.fetched_requirements), language="json")
+                st.code(pretty(ss.fetched_requirements), language="json")
 
     with colB:
         st.markdown("### Quick checks")
-        if not st.session_state.kb_ready and not st.session_state.last_index_result:
+        if not ss.kb_ready and not ss.last_index_result:
             st.warning("Knowledge base not built yet. Go to Step 1 and build it first.")
         else:
             st.success("Knowledge base is ready ✅")
@@ -456,7 +928,7 @@ elif st.session_state.step == "2) Connect Jira & Import Requirements":
         else:
             st.info("Add a Jira issue key to link requirements.")
 
-        applied = requirements_count(st.session_state.product_pack)
+        applied = requirements_count(ss.product_pack)
         st.metric("Requirements in use", applied)
 
         st.caption("Tip: If requirements show 0 here, you can still generate if backend fetches from Jira using jira_issue_key.")
@@ -465,10 +937,11 @@ elif st.session_state.step == "2) Connect Jira & Import Requirements":
 # STEP 3: Project Settings
 # ============================================================
 elif st.session_state.step == "3) Project Settings (Business Rules + Jira Output)":
+    ss = st.session_state
     st.subheader("3) Project Settings")
     st.caption("Light setup: product name/domain, business rules, and Jira output configuration.")
 
-    pp = st.session_state.product_pack
+    pp = ss.product_pack
 
     col1, col2 = st.columns([1.2, 1], gap="large")
     with col1:
@@ -488,14 +961,13 @@ elif st.session_state.step == "3) Project Settings (Business Rules + Jira Output
 
         st.markdown("### Requirements currently in use")
         if requirements_count(pp) > 0:
-            for r in (pp.get("requirements") or [])[:20]:
-                st.write(f"- **{r.get('id')}**: {r.get('statement')}")
+            st.markdown("\n".join(f"- **{r.get('id')}**: {r.get('statement')}" for r in (pp.get("requirements") or [])[:20]))
             if requirements_count(pp) > 20:
                 st.caption(f"Showing first 20 of {requirements_count(pp)}")
         else:
             st.info("No requirements applied yet. Step 2 can import them from Jira, or backend can fetch during generation.")
 
-        if st.session_state.developer_mode:
+        if ss.developer_mode:
             with st.expander("Developer view: product_pack JSON", expanded=False):
                 st.code(pretty(pp), language="json")
 
@@ -518,35 +990,35 @@ elif st.session_state.step == "3) Project Settings (Business Rules + Jira Output
 
         if issues:
             st.warning("A few things to fix:")
-            for i in issues:
-                st.write(f"- {i}")
+            st.markdown("\n".join(f"- {i}" for i in issues))
         else:
             st.success("Looks good ✅")
 
         st.divider()
         st.download_button(
             "⬇️ Download project_settings.json",
-            data=pretty(pp),
+            data=pretty_bytes(pp),
             file_name="project_settings.json",
             mime="application/json",
             use_container_width=True,
         )
 
-    st.session_state.product_pack = pp
+    ss.product_pack = pp
 
 # ============================================================
 # STEP 4: Create Test Scenarios
 # ============================================================
 elif st.session_state.step == "4) Create Test Scenarios":
+    ss = st.session_state
     st.subheader("4) Create Test Scenarios")
     st.caption("We’ll generate scenario-level test ideas grounded in your docs + Jira requirements.")
 
-    if not (st.session_state.kb_ready or st.session_state.last_index_result):
+    if not (ss.kb_ready or ss.last_index_result):
         st.error("Knowledge base not ready. Go back to Step 1 and build it first.")
         st.stop()
 
-    pp = st.session_state.product_pack
-    issue_key = (st.session_state.jira_issue_key or "").strip()
+    pp = ss.product_pack
+    issue_key = (ss.jira_issue_key or "").strip()
     req_in_use = requirements_count(pp)
 
     colA, colB = st.columns([1, 1], gap="large")
@@ -569,31 +1041,33 @@ elif st.session_state.step == "4) Create Test Scenarios":
         if st.button("✨ Create scenarios", type="primary", use_container_width=True, disabled=not can_generate):
             try:
                 payload = {
-                    "tenant_id": st.session_state.project_name,
+                    "tenant_id": ss.project_name,
                     "product_pack": pp,
                     "max_scenarios": max_scenarios,
                     # NEW Jira-based requirement flow (backend should support these flags)
                     "jira_issue_key": issue_key or None,
                     "fetch_requirements_from_jira": True,
                 }
-                res = api_post(st.session_state.api_base, "/v1/scenarios", payload, timeout=300)
-                st.session_state.scenario_pack = res
+                res, raw = api_post_raw(ss.api_base, "/v1/scenarios", payload, timeout=300)
+                set_scenario_pack(res, raw)
                 st.success("Scenarios generated ✅")
             except Exception as e:
                 st.error(str(e))
-                if st.session_state.developer_mode:
-                    st.code(pretty({"payload": payload}), language="json")
+                if ss.developer_mode:
+                    with st.expander("Developer view: request payload", expanded=False):
+                        st.code(pretty({"payload": payload}), language="json")
 
     with colB:
-        sp = st.session_state.scenario_pack
+        sp = ss.scenario_pack
         scs = scenario_list(sp)
 
         st.markdown("### Results")
         if not scs:
             st.info("No scenarios yet. Generate on the left.")
         else:
-            st.metric("Scenarios", len(scs))
-            st.metric("Total test cases", total_testcases(sp))
+            n_sc, n_tc = pack_counts(sp)
+            st.metric("Scenarios", n_sc)
+            st.metric("Total test cases", n_tc)
             st.caption("Test cases will be 0 until Step 5.")
 
             # Friendly browse
@@ -601,159 +1075,192 @@ elif st.session_state.step == "4) Create Test Scenarios":
             search = st.text_input("Search scenarios", placeholder="type keyword…")
             show_n = st.slider("Show top", 5, min(30, len(scs)), min(12, len(scs)), 1)
 
-            shown = []
-            for s in scs:
-                title = (s.get("title") or "")
-                obj = (s.get("objective") or "")
-                blob = (title + " " + obj).lower()
-                if search and search.lower() not in blob:
-                    continue
-                shown.append(s)
+            if search:
+                q = search.lower()
+                shown = [s for s, blob in scenario_search_index(sp) if q in blob]
+            else:
+                shown = scs
 
             if not shown:
                 st.warning("No matches.")
             else:
-                for s in shown[:show_n]:
-                    sid = s.get("scenario_id", "(no-id)")
-                    title = s.get("title", "(no-title)")
-                    tc_cnt = len(s.get("test_cases") or [])
-                    ref_cnt = len(s.get("references") or [])
-                    with st.expander(f"🧩 {sid} — {title}  •  refs:{ref_cnt}  •  tcs:{tc_cnt}", expanded=False):
-                        st.write(s.get("objective") or "—")
-                        cols = st.columns(2)
-                        with cols[0]:
-                            st.caption("Scope")
-                            scope = s.get("scope") or []
-                            st.write("\n".join([f"- {x}" for x in scope]) if scope else "—")
-                        with cols[1]:
-                            st.caption("Assumptions")
-                            a = s.get("assumptions") or []
-                            st.write("\n".join([f"- {x}" for x in a]) if a else "—")
-
-                        if st.session_state.developer_mode:
-                            st.divider()
-                            st.caption("Raw JSON")
-                            st.code(pretty(s), language="json")
+                dev = ss.developer_mode
+                page = shown[:show_n]
+                if len(page) > SCENARIO_TABLE_MIN_ROWS:
+                    # One table instead of N expanders; details only for the selected row.
+                    event = st.dataframe(
+                        scenario_table(page),
+                        use_container_width=True,
+                        hide_index=True,
+                        on_select="rerun",
+                        selection_mode="single-row",
+                        key="scenario_table",
+                    )
+                    rows = event.selection.rows
+                    if rows:
+                        s = page[rows[0]]
+                        st.markdown(f"#### 🧩 {s.get('scenario_id', '(no-id)')} — {s.get('title', '(no-title)')}")
+                        render_scenario_details(sp, s, dev)
+                    else:
+                        st.caption("Select a row to see scenario details.")
+                else:
+                    for s in page:
+                        sid = s.get("scenario_id", "(no-id)")
+                        title = s.get("title", "(no-title)")
+                        tc_cnt = len(s.get("test_cases") or [])
+                        ref_cnt = len(s.get("references") or [])
+                        with st.expander(f"🧩 {sid} — {title}  •  refs:{ref_cnt}  •  tcs:{tc_cnt}", expanded=False):
+                            render_scenario_details(sp, s, dev)
 
 # ============================================================
 # STEP 5: Create Detailed Test Cases
 # ============================================================
 elif st.session_state.step == "5) Create Detailed Test Cases":
+    ss = st.session_state
     st.subheader("5) Create Detailed Test Cases")
     st.caption("Now we expand each scenario into detailed test cases with steps, expected results, and references.")
 
-    if not scenario_list(st.session_state.scenario_pack):
+    sp = ss.scenario_pack
+    if not scenario_list(sp):
         st.warning("No scenarios found. Generate scenarios in Step 4 first.")
         st.stop()
 
-    pp = st.session_state.product_pack
-    issue_key = (st.session_state.jira_issue_key or "").strip()
+    pp = ss.product_pack
+    issue_key = (ss.jira_issue_key or "").strip()
 
     colA, colB = st.columns([1, 1], gap="large")
     with colA:
         st.markdown("### Generate")
         st.caption("This can take time depending on model + number of scenarios. (Yes, the AI is thinking… not buffering 😄)")
 
+        reuse = st.checkbox(
+            "Reuse the previous result when inputs are unchanged",
+            value=True,
+            help="Untick to force a fresh generation for the same scenarios and settings.",
+        )
         if st.button("🧾 Create test cases", type="primary", use_container_width=True):
             try:
                 payload = {
-                    "tenant_id": st.session_state.project_name,
+                    "tenant_id": ss.project_name,
                     "product_pack": pp,
-                    "scenario_pack": st.session_state.scenario_pack,
+                    "scenario_pack": sp,
                     "jira_issue_key": issue_key or None,
                     "fetch_requirements_from_jira": True,
                 }
-                res = api_post(st.session_state.api_base, "/v1/testcases", payload, timeout=900)
-                st.session_state.scenario_pack = res
-                st.success("Test cases generated ✅")
+                tc_cache = ss.setdefault("_tc_cache", {})
+                key = testcases_request_key(payload)
+                if reuse and key in tc_cache:
+                    res, raw = tc_cache[key]
+                    complete = True
+                    st.info("Inputs unchanged since the last generation — reused that result.")
+                else:
+                    status = st.empty()
+                    # closing() releases the streamed response even if merging stops before the last event.
+                    with contextlib.closing(api_post_stream(ss.api_base, "/v1/testcases", payload)) as events:
+                        res, raw, complete = merge_testcase_events(
+                            sp,
+                            events,
+                            on_progress=lambda n: status.caption(f"Received {n} test cases…"),
+                        )
+                    status.empty()
+                    tc_cache.pop(key, None)
+                    # Only a stream the backend finished is worth replaying; a partial one is shown once.
+                    if complete:
+                        tc_cache[key] = (res, raw)
+                        while len(tc_cache) > TESTCASE_CACHE_MAX:
+                            tc_cache.pop(next(iter(tc_cache)))
+                set_scenario_pack(res, raw)
+                sp = res
+                if complete:
+                    st.success("Test cases generated ✅")
+                else:
+                    st.warning(
+                        f"The test case stream ended before the backend signalled completion; "
+                        f"{pack_counts(res)[1]} test cases were received and may be incomplete."
+                    )
             except Exception as e:
                 st.error(str(e))
-                if st.session_state.developer_mode:
-                    st.code(pretty({"payload": payload}), language="json")
+                if ss.developer_mode:
+                    with st.expander("Developer view: request payload", expanded=False):
+                        st.code(pretty({"payload": payload}), language="json")
 
-        sp = st.session_state.scenario_pack
+        n_sc, tc_total = pack_counts(sp)
         st.divider()
-        st.metric("Scenarios", len(scenario_list(sp)))
-        st.metric("Total test cases", total_testcases(sp))
+        st.metric("Scenarios", n_sc)
+        st.metric("Total test cases", tc_total)
 
     with colB:
         st.markdown("### Browse test cases")
-        sp = st.session_state.scenario_pack
         scs = scenario_list(sp)
-        tc_total = total_testcases(sp)
 
         if tc_total == 0:
             st.info("No test cases yet. Generate them on the left.")
         else:
-            # Build a light list for browsing
-            scenario_titles = [f"{s.get('scenario_id','(no-id)')} — {s.get('title','(no-title)')}" for s in scs]
-            idx = st.selectbox("Pick a scenario", range(len(scs)), format_func=lambda i: scenario_titles[i])
-            s = scs[idx]
-            tcs = s.get("test_cases") or []
-
-            tc_type = st.selectbox(
-                "Filter by type",
-                ["All", "Functional", "Negative", "Edge", "Security", "Performance", "Recovery"],
-                index=0,
-            )
-            q = st.text_input("Search in test case title", placeholder="keyword…")
+            titles = scenario_titles(sp)
+            idx = st.selectbox("Pick a scenario", range(len(scs)), format_func=titles.__getitem__, key="tc_browse_scenario")
+            tcs = typed_testcases(sp)[idx]
 
-            filtered = []
-            for tc in tcs:
-                if tc_type != "All" and tc.get("type") != tc_type:
-                    continue
-                if q and q.lower() not in (tc.get("title") or "").lower():
-                    continue
-                filtered.append(tc)
-
-            st.caption(f"Showing {len(filtered)} of {len(tcs)} test cases")
-
-            for tc in filtered[:30]:
-                tc_id = tc.get("tc_id", "(no-id)")
-                title = tc.get("title", "(no-title)")
-                pr = tc.get("priority", "—")
-                with st.expander(f"✅ {tc_id} — {title}  •  {tc.get('type','—')}  •  {pr}", expanded=False):
-                    st.markdown("**Preconditions**")
-                    pre = tc.get("preconditions") or []
-                    st.write("\n".join([f"- {x}" for x in pre]) if pre else "—")
-
-                    st.markdown("**Steps**")
-                    steps = tc.get("steps") or []
-                    if steps:
-                        for i, step in enumerate(steps, start=1):
-                            st.write(f"{i}. {step}")
-                    else:
-                        st.write("—")
+            tc_types = st.multiselect("Filter by type", TESTCASE_TYPES, placeholder="All types")
+            allowed = frozenset(tc_types) if tc_types else None
+            q = st.text_input("Search in test case title", placeholder="keyword…")
 
-                    st.markdown("**Expected results**")
-                    exp = tc.get("expected_results") or []
-                    if exp:
-                        for i, er in enumerate(exp, start=1):
-                            st.write(f"{i}. {er}")
-                    else:
-                        st.write("—")
+            if allowed is None and not q:
+                filtered = tcs
+            else:
+                ql = q.lower()
+                filtered = [
+                    tc
+                    for title_lower, tc in testcase_index(sp, idx)
+                    if (allowed is None or tc.type in allowed) and (not ql or ql in title_lower)
+                ]
+
+            n_pages = max(1, math.ceil(len(filtered) / TESTCASE_PAGE_SIZE))
+            page = st.number_input("Page", min_value=1, max_value=n_pages, value=1, step=1)
+            start = (page - 1) * TESTCASE_PAGE_SIZE
+            st.caption(f"Showing {len(filtered)} of {len(tcs)} test cases (page {page} of {n_pages})")
+
+            dev = ss.developer_mode
+            for tc in filtered[start : start + TESTCASE_PAGE_SIZE]:
+                with st.expander(
+                    f"✅ {tc.tc_id} — {tc.title or '(no-title)'}  •  {tc.type or '—'}  •  {tc.priority}", expanded=False
+                ):
+                    st.markdown(
+                        "**Preconditions**\n\n"
+                        + ("\n".join(f"- {x}" for x in tc.preconditions) or "—")
+                        + "\n\n**Steps**\n\n"
+                        + ("\n".join(f"{i}. {x}" for i, x in enumerate(tc.steps, start=1)) or "—")
+                        + "\n\n**Expected results**\n\n"
+                        + ("\n".join(f"{i}. {x}" for i, x in enumerate(tc.expected_results, start=1)) or "—")
+                    )
 
-                    refs = tc.get("references") or []
+                    refs = tc.references
                     st.caption(f"References: {len(refs)}")
-                    if refs and not st.session_state.developer_mode:
+                    all_refs = len(refs) > REFS_PREVIEW and st.checkbox(
+                        f"Show all {len(refs)} refs", key=f"tc_refs_{id(tc.raw)}"
+                    )
+                    if refs and not dev:
                         # show compact references
-                        for r in refs[:5]:
-                            st.write(f"- {r.get('doc','')} • {r.get('section','')}")
-                        if len(refs) > 5:
-                            st.caption(f"+{len(refs)-5} more")
+                        shown_refs = refs if all_refs else refs[:REFS_PREVIEW]
+                        st.markdown("\n".join(f"- {r.get('doc','')} • {r.get('section','')}" for r in shown_refs))
 
-                    if st.session_state.developer_mode:
+                    if dev:
                         st.divider()
-                        st.code(pretty(tc), language="json")
+                        if st.checkbox("Show JSON", key=f"tc_json_{id(tc.raw)}"):
+                            if all_refs or len(refs) <= REFS_PREVIEW:
+                                st.code(pretty_in_pack(sp, tc.raw), language="json")
+                            else:
+                                st.code(pretty({**tc.raw, "references": refs[:REFS_PREVIEW]}), language="json")
+                                st.caption(f"references truncated to {REFS_PREVIEW} of {len(refs)}")
 
 # ============================================================
 # STEP 6: Export / Push to Jira
 # ============================================================
 elif st.session_state.step == "6) Export / Push to Jira":
+    ss = st.session_state
     st.subheader("6) Export / Push to Jira")
     st.caption("Download results or push issues to Jira.")
 
-    sp = st.session_state.scenario_pack
+    sp = ss.scenario_pack
     scs = scenario_list(sp)
     tc_total = total_testcases(sp)
 
@@ -765,30 +1272,19 @@ elif st.session_state.step == "6) Export / Push to Jira":
 
     with colA:
         st.markdown("### Download")
-        st.download_button(
-            "⬇️ scenario_pack.json",
-            data=pretty(sp),
-            file_name="scenario_pack.json",
-            mime="application/json",
-            use_container_width=True,
-        )
+        # Encoded (and handed to Streamlit's media store) only on request, not on every rerun.
+        if st.button("📦 Prepare scenario_pack.json"):
+            st.download_button(
+                "⬇️ scenario_pack.json",
+                data=session_memo("scenario_pack_bytes", sp, lambda: pretty_bytes(sp)),
+                file_name="scenario_pack.json",
+                mime="application/json",
+                use_container_width=True,
+            )
 
         # Flat CSV
         if st.button("📄 Create flat CSV"):
-            lines = ["scenario_id,scenario_title,tc_id,tc_title,tc_type,priority"]
-            for s in scs:
-                sid = (s.get("scenario_id") or "").replace(",", " ")
-                stitle = (s.get("title") or "").replace(",", " ")
-                for tc in (s.get("test_cases") or []):
-                    lines.append(",".join([
-                        sid,
-                        stitle,
-                        (tc.get("tc_id") or "").replace(",", " "),
-                        (tc.get("title") or "").replace(",", " "),
-                        (tc.get("type") or "").replace(",", " "),
-                        (tc.get("priority") or "").replace(",", " "),
-                    ]))
-            csv_data = "\n".join(lines)
+            csv_data = session_memo("flat_csv", sp, lambda: flat_testcases_csv(sp))
             st.download_button(
                 "⬇️ flat_testcases.csv",
                 data=csv_data,
@@ -802,9 +1298,13 @@ elif st.session_state.step == "6) Export / Push to Jira":
         st.write(f"- Scenarios: **{len(scs)}**")
         st.write(f"- Test cases: **{tc_total}**")
 
-        if st.session_state.developer_mode:
+        if ss.developer_mode:
             with st.expander("Developer view: raw scenario_pack", expanded=False):
-                st.code(pretty(sp), language="json")
+                raw = ss.scenario_pack_raw
+                if raw:
+                    st.code(raw.decode("utf-8", "replace"), language="json", wrap_lines=True)
+                else:
+                    st.code(session_memo("scenario_pack_json", sp, lambda: pretty(sp)), language="json")
 
     with colB:
         st.markdown("### Push to Jira")
@@ -817,38 +1317,73 @@ elif st.session_state.step == "6) Export / Push to Jira":
             default=["QA", "AutoGen"],
         )
 
-        push_disabled = not scs
+        pushed = ss.jira_pushed_scenarios
+        pending = [i for i in range(len(scs)) if i not in pushed]
+        if pushed and pending:
+            st.caption(f"{len(scs) - len(pending)} of {len(scs)} scenarios are already in Jira; only the remaining {len(pending)} will be pushed.")
+        elif not pending:
+            st.caption("Every scenario in this pack has been pushed to Jira.")
+
+        push_disabled = not pending
         if st.button("🚀 Send to Jira", type="primary", use_container_width=True, disabled=push_disabled):
             try:
                 payload = {
-                    "product_pack": st.session_state.product_pack,
+                    "product_pack": ss.product_pack,
                     "scenario_pack": sp,
-                    "label_prefix": label_prefix,
+                    # Order-independent, so identical label choices always produce identical payloads.
+                    "label_prefix": sorted(set(label_prefix)),
                 }
-                res = api_post(st.session_state.api_base, "/v1/jira/push", payload, timeout=600)
-                st.session_state.last_jira_result = res
-                st.success("Pushed to Jira ✅")
+                scenario_batches = jira_push_batches([scs[i] for i in pending])
+                batches = [{**payload, "scenario_pack": {**sp, "scenarios": batch}} for batch in scenario_batches]
+                progress = st.progress(0.0, text=f"Pushing {len(batches)} batch(es) to Jira…")
+                results: Dict[int, Dict[str, Any]] = {}
+                failed: Dict[int, Exception] = {}
+                for done, (i, res, err) in enumerate(api_post_many(ss.api_base, "/v1/jira/push", batches), 1):
+                    if err is None:
+                        results[i] = res
+                    else:
+                        failed[i] = err
+                    progress.progress(done / len(batches), text=f"Pushed {done} of {len(batches)} batch(es)")
+                # Record every batch that was created, even if others failed, so a retry only sends the rest
+                # and its result is merged into this one.
+                if results:
+                    position = {id(s): i for i, s in enumerate(scs)}
+                    for i in results:
+                        pushed.update(position[id(s)] for s in scenario_batches[i])
+                    prev = [ss.last_jira_result] if ss.last_jira_result and len(pending) < len(scs) else []
+                    drop_session_memos(ss.last_jira_result)
+                    ss.last_jira_result = merge_jira_results(prev + [results[i] for i in sorted(results)])
+                if failed:
+                    for i in sorted(failed):
+                        ids = ", ".join(str(s.get("scenario_id") or "?") for s in scenario_batches[i])
+                        st.error(f"Push failed for scenarios {ids}: {failed[i]}")
+                    if results:
+                        st.warning(f"{len(results)} of {len(batches)} batch(es) were pushed; pressing Send again pushes only the failed scenarios.")
+                else:
+                    st.success("Pushed to Jira ✅")
             except Exception as e:
                 st.error(str(e))
-                if st.session_state.developer_mode:
-                    st.code(pretty({"payload": payload}), language="json")
+                if ss.developer_mode:
+                    with st.expander("Developer view: request payload", expanded=False):
+                        st.code(pretty({"payload": payload}), language="json")
 
-        if st.session_state.last_jira_result:
+        jira_res = ss.last_jira_result
+        if jira_res:
             st.markdown("### Jira result")
-            if not st.session_state.developer_mode:
-                scenario_keys = st.session_state.last_jira_result.get("scenario_keys") or []
-                testcase_keys = st.session_state.last_jira_result.get("testcase_keys") or []
+            if not ss.developer_mode:
+                scenario_keys = jira_res.get("scenario_keys") or []
+                testcase_keys = jira_res.get("testcase_keys") or []
                 st.write(f"Created scenarios: **{len(scenario_keys)}**")
                 st.write(f"Created test cases: **{len(testcase_keys)}**")
                 st.download_button(
                     "⬇️ jira_result.json",
-                    data=pretty(st.session_state.last_jira_result),
+                    data=session_memo("jira_result_bytes", jira_res, lambda: pretty_bytes(jira_res)),
                     file_name="jira_result.json",
                     mime="application/json",
                     use_container_width=True,
                 )
             else:
-                st.code(pretty(st.session_state.last_jira_result), language="json")
+                st.code(session_memo("jira_result_json", jira_res, lambda: pretty(jira_res)), language="json")
 
 # ============================================================
 # Footer vibes